@@ -1,12 +1,17 @@
 from __future__ import annotations
 
+import asyncio
+import reprlib
+import time
 import uuid
 import warnings
-from datetime import datetime, timezone
+from collections import deque
+from functools import lru_cache
+from itertools import islice
 from typing import Any, Literal
 
 # UI Improvements
-from rich.console import Console
+from rich.console import Console, Group
 from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.text import Text
@@ -17,15 +22,10 @@ from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
 from orchestrator import build_app, check_tester_service, TESTER_URL
 
 # --- 1. Deprecation Warnings ---
-# Silence the specific datetime warning and Pydantic-related ones
+# Silence the datetime.utcfromtimestamp() deprecation (one pattern covers both wordings)
 warnings.filterwarnings(
-    "ignore", 
-    message=".*datetime.datetime.utcfromtimestamp().*", 
-    category=DeprecationWarning
-)
-warnings.filterwarnings(
-    "ignore", 
-    message=".*support for `datetime.datetime.utcfromtimestamp()`.*", 
+    "ignore",
+    message=r".*utcfromtimestamp.*",
     category=DeprecationWarning
 )
 
@@ -44,17 +44,63 @@ console = Console(theme=custom_theme)
 TraceLevel = Literal["off", "basic", "debug"]
 
 # Keys we consider useful to surface during execution.
-TRACE_KEYS = {
+TRACE_KEYS: frozenset[str] = frozenset({
     "route", "task", "original_task", "planner_used", "plan", "plan_step",
     "awaiting_approval", "iterations", "max_iters", "compile_attempts",
     "compile_result", "compile_errors", "test_attempts", "max_test_attempts",
     "tests", "test_result", "tester_error", "validated_code", "validation_summary",
     "safety_notes", "code", "assembled_code", "diagnostics", "workspace",
-}
+})
+
+
+# [epoch second, formatted "HH:MM:SS"] - strftime only runs when the second changes
+_TS_CACHE: list[Any] = [-1, ""]
 
 
 def _ts() -> str:
-    return datetime.now(timezone.utc).strftime("%H:%M:%S.%f")[:-3]
+    now = time.time()
+    sec = int(now)
+    if sec != _TS_CACHE[0]:
+        _TS_CACHE[0] = sec
+        _TS_CACHE[1] = time.strftime("%H:%M:%S", time.gmtime(sec))
+    return f"{_TS_CACHE[1]}.{int((now - sec) * 1000):03d}"
+
+
+# Largest max_len any trace preview uses
+_PREVIEW_MAX_LEN = 500
+
+class _PreviewRepr(reprlib.Repr):
+    """reprlib.Repr that keeps dict and set iteration order, like str()."""
+
+    def repr_dict(self, x: dict, level: int) -> str:
+        if not x:
+            return "{}"
+        if level <= 0:
+            return "{" + self.fillvalue + "}"
+        pieces = [
+            f"{self.repr1(k, level - 1)}: {self.repr1(val, level - 1)}"
+            for k, val in islice(x.items(), self.maxdict)
+        ]
+        if len(x) > self.maxdict:
+            pieces.append(self.fillvalue)
+        return "{" + ", ".join(pieces) + "}"
+
+    def repr_set(self, x: set, level: int) -> str:
+        return self._repr_iterable(x, level, "{", "}", self.maxset) if x else "set()"
+
+    def repr_frozenset(self, x: frozenset, level: int) -> str:
+        return self._repr_iterable(x, level, "frozenset({", "})", self.maxfrozenset) if x else "frozenset()"
+
+
+# Stops container reprs early without changing the first max_len chars: an
+# element costs at least 3 chars ("x, ") and a nesting level at least 1, and
+# scalars are only cut in the middle once they pass twice max_len.
+_PREVIEW_REPR = _PreviewRepr()
+_PREVIEW_REPR.maxstring = _PREVIEW_REPR.maxother = _PREVIEW_REPR.maxlong = 2 * _PREVIEW_MAX_LEN + 3
+_PREVIEW_REPR.maxlevel = _PREVIEW_MAX_LEN
+_PREVIEW_REPR.maxdict = _PREVIEW_REPR.maxlist = _PREVIEW_REPR.maxtuple = _PREVIEW_MAX_LEN // 3 + 1
+_PREVIEW_REPR.maxset = _PREVIEW_REPR.maxfrozenset = _PREVIEW_REPR.maxdeque = _PREVIEW_MAX_LEN // 3 + 1
+_PREVIEW_CONTAINERS = (dict, list, tuple, set, frozenset, deque)
 
 
 def _safe_preview(v: Any, max_len: int = 220) -> str:
@@ -65,23 +111,39 @@ def _safe_preview(v: Any, max_len: int = 220) -> str:
     if isinstance(v, BaseMessage):
         return _preview_message(v, max_len=max_len)
 
-    if isinstance(v, list) and v and all(isinstance(x, BaseMessage) for x in v):
-        tail = v[-2:] if len(v) >= 2 else v
-        return " | ".join(_preview_message(m, max_len=max_len) for m in tail)
-
-    s = str(v).replace("\n", "\\n")
+    # Only the last two messages are shown, so only those need checking
+    if isinstance(v, list) and v and isinstance(v[-1], BaseMessage):
+        last = _preview_message(v[-1], max_len=max_len)
+        if len(v) >= 2 and isinstance(v[-2], BaseMessage):
+            return _preview_message(v[-2], max_len=max_len) + " | " + last
+        return last
+
+    # Strings are sliced and plain containers stop once they overflow max_len;
+    # anything else keeps its str()
+    if isinstance(v, str):
+        s = v[: max_len + 1]
+    elif type(v) in _PREVIEW_CONTAINERS:
+        s = _PREVIEW_REPR.repr(v)
+    else:
+        s = str(v)
+    if "\n" in s:
+        s = s.replace("\n", "\\n")
     return s if len(s) <= max_len else (s[: max_len - 3] + "...")
 
 
 def _preview_message(m: BaseMessage, max_len: int = 220) -> str:
-    role = getattr(m, "type", None) or m.__class__.__name__
-    name = getattr(m, "name", None)
-    content = getattr(m, "content", "") or ""
+    # `type`, `name` and `content` are declared fields on every BaseMessage
+    role = m.type or m.__class__.__name__
+    name = m.name
+    content = m.content or ""
 
     tool_calls = getattr(m, "tool_calls", None)
     tc = f" tool_calls={len(tool_calls)}" if tool_calls else ""
 
-    content_str = str(content).replace("\n", "\\n")
+    # Slice before escaping so the work is O(max_len), not O(len(content))
+    content_str = content[: max_len + 1] if isinstance(content, str) else _PREVIEW_REPR.repr(content)
+    if "\n" in content_str:
+        content_str = content_str.replace("\n", "\\n")
     if len(content_str) > max_len:
         content_str = content_str[: max_len - 3] + "..."
 
@@ -89,31 +151,41 @@ def _preview_message(m: BaseMessage, max_len: int = 220) -> str:
     return f"{label}{tc}: {content_str}".strip()
 
 
-def _build_structured_answer(summary: str, safety: str, code: str) -> str:
-    """Build answer from structured fields (summary, safety, code)."""
+def _build_structured_answer(summary: str | None, safety: str | None, code: str | None) -> str:
+    """Build answer from already-cleaned structured fields (summary, safety, code)."""
     parts: list[str] = []
     
-    if isinstance(summary, str) and summary.strip():
-        parts.append(f"**SUMMARY**: {summary.strip()}")
+    if summary:
+        parts.append(f"**SUMMARY**: {summary}")
     
-    if isinstance(safety, str) and safety.strip():
-        parts.append(f"**SAFETY**: {safety.strip()}")
+    if safety:
+        parts.append(f"**SAFETY**: {safety}")
         
-    if isinstance(code, str) and code.strip():
-        clean_code = code.strip('\n')
-        parts.append(f"```c\n{clean_code}\n```")
+    if code:
+        parts.append(f"```c\n{code}\n```")
     
     return "\n\n".join(parts)
 
 
+def _nonempty(d: dict[str, Any], key: str) -> str | None:
+    """Return the stripped string stored at `key`, or None if missing/blank."""
+    v = d.get(key)
+    if isinstance(v, str):
+        v = v.strip()
+        if v:
+            return v
+    return None
+
+
 def _extract_message_answer(final_state: dict[str, Any]) -> str:
     """Fallback to the last message if no structured data."""
     msgs: list[BaseMessage] = final_state.get("messages") or []
     if msgs:
-        last = msgs[-1]
-        content = getattr(last, "content", "") or ""
-        if content.strip():
-            return content.strip()
+        content = getattr(msgs[-1], "content", "") or ""
+        if isinstance(content, str):
+            content = content.strip()
+            if content:
+                return content
     return "No output generated."
 
 
@@ -122,19 +194,19 @@ def _extract_answer(final_state: dict[str, Any]) -> str:
     Extracts the final answer from state.
     Code is wrapped in Markdown blocks to preserve indentation.
     """
-    summary = final_state.get("validation_summary")
-    safety = final_state.get("safety_notes")
-    code = final_state.get("code") or final_state.get("assembled_code") or ""
+    summary = _nonempty(final_state, "validation_summary")
+    safety = _nonempty(final_state, "safety_notes")
+    code = final_state.get("code") or final_state.get("assembled_code")
+    # Only trim blank lines: leading spaces on the first line are indentation
+    code = code.strip("\n") if isinstance(code, str) and not code.isspace() else None
 
-    has_structured = bool(summary or safety or code)
-    if has_structured:
-        answer = _build_structured_answer(summary, safety, code)
-        if answer:
-            return answer
+    if summary or safety or code:
+        return _build_structured_answer(summary, safety, code)
 
     return _extract_message_answer(final_state)
 
 
+@lru_cache(maxsize=256)
 def _fmt_namespace(ns: tuple[str, ...]) -> str:
     if not ns:
         return "root"
@@ -145,30 +217,43 @@ def _fmt_namespace(ns: tuple[str, ...]) -> str:
     return "/".join(parts)
 
 
+def _trace_line(label: str, value: str, style: str = "trace.content") -> Text:
+    line = Text("  ")
+    line.append(label, style=style)
+    line.append(f" {value}")
+    return line
+
+
 def _print_updates(ns: tuple[str, ...], node: str, updates: dict[str, Any]) -> None:
-    msg_patch = updates.get("messages") if isinstance(updates, dict) else None
-    interrupt_patch = updates.get("__interrupt__") if isinstance(updates, dict) else None
+    # Callers only pass dict patches (see _handle_updates_mode)
+    msg_patch = updates.get("messages")
+    interrupt_patch = updates.get("__interrupt__")
 
-    interesting = {k: v for k, v in (updates or {}).items() if k in TRACE_KEYS}
-    has_any = bool(interesting) or (msg_patch is not None) or (interrupt_patch is not None)
-    
-    if not has_any:
+    # C-level set intersection instead of a per-key Python filter
+    trace_keys = updates.keys() & TRACE_KEYS
+
+    if not trace_keys and msg_patch is None and interrupt_patch is None:
         return
 
     phase = _fmt_namespace(ns)
     header = Text(f"[{_ts()}] ", style="timestamp")
     header.append(f"[{phase}] ", style="info")
     header.append(node, style="trace.header")
-    console.print(header)
+    lines: list[Text] = [header]
 
     if msg_patch is not None:
-        console.print(f"  [trace.content]• messages:[/trace.content] {_safe_preview(msg_patch)}")
+        lines.append(_trace_line("• messages:", _safe_preview(msg_patch)))
 
     if interrupt_patch is not None:
-        console.print(f"  [warning]• __interrupt__:[/warning] {_safe_preview(interrupt_patch, max_len=500)}")
+        lines.append(_trace_line("• __interrupt__:", _safe_preview(interrupt_patch, max_len=_PREVIEW_MAX_LEN), style="warning"))
 
-    for k, v in interesting.items():
-        console.print(f"  [trace.content]• {k}:[/trace.content] {_safe_preview(v)}")
+    # Walk `updates` rather than the set so keys print in the order the node emitted them
+    for k in updates:
+        if k in trace_keys:
+            lines.append(_trace_line(f"• {k}:", _safe_preview(updates[k])))
+
+    # One render + write per event instead of one per line
+    console.print(Group(*lines))
 
 
 def _print_debug(ns: tuple[str, ...], chunk: Any) -> None:
@@ -182,40 +267,46 @@ def _print_debug(ns: tuple[str, ...], chunk: Any) -> None:
         header = Text(f"[{_ts()}] ", style="timestamp")
         header.append(f"[{phase}] ", style="info")
         header.append(f"DEBUG {typ} ({node})", style="dim magenta")
-        console.print(header)
         
         if payload is not chunk:
-            console.print(f"  [dim]payload:[/dim] {_safe_preview(payload, max_len=500)}")
+            body = _trace_line("payload:", _safe_preview(payload, max_len=_PREVIEW_MAX_LEN), style="dim")
         else:
             keys = list(chunk.keys())
-            console.print(f"  [dim]keys:[/dim] {keys[:30]}")
-        console.print("")
+            body = _trace_line("keys:", str(keys[:30]), style="dim")
+        console.print(Group(header, body, Text("")))
         return
 
-    console.print(f"[{_ts()}] [{phase}] DEBUG: {_safe_preview(chunk, max_len=500)}\n", style="dim")
+    console.print(f"[{_ts()}] [{phase}] DEBUG: {_safe_preview(chunk, max_len=_PREVIEW_MAX_LEN)}\n", style="dim", markup=False)
+
+
+def _split2(item: tuple) -> tuple[tuple[str, ...], str | None, Any]:
+    a, b = item
+    if type(a) is tuple:
+        return a, None, b
+    if type(a) is str:
+        return (), a, b
+    return (), None, item
+
+
+def _split3(item: tuple) -> tuple[tuple[str, ...], str | None, Any]:
+    a, b, c = item
+    if type(a) is tuple and type(b) is str:
+        return a, b, c
+    return (), None, item
+
+
+def _split_default(item: Any) -> tuple[tuple[str, ...], str | None, Any]:
+    return (), None, item
+
+
+# stream(subgraphs=True) yields (ns, chunk) or (ns, mode, chunk) depending on stream_mode
+_SPLIT_DISPATCH = {2: _split2, 3: _split3}
 
 
 def _split_stream_item(item: Any) -> tuple[tuple[str, ...], str | None, Any]:
-    ns: tuple[str, ...] = ()
-    mode: str | None = None
-    chunk: Any = item
-
-    if isinstance(item, tuple):
-        if len(item) == 2:
-            a, b = item
-            if isinstance(a, tuple):
-                ns = a
-                chunk = b
-            elif isinstance(a, str):
-                mode = a
-                chunk = b
-        elif len(item) == 3:
-            a, b, c = item
-            if isinstance(a, tuple) and isinstance(b, str):
-                ns = a
-                mode = b
-                chunk = c
-    return ns, mode, chunk
+    if type(item) is not tuple:
+        return (), None, item
+    return _SPLIT_DISPATCH.get(len(item), _split_default)(item)
 
 
 def _handle_updates_mode(chunk: dict, ns: tuple[str, ...], final_state: dict[str, Any]) -> dict[str, Any]:
@@ -244,24 +335,22 @@ def _process_stream_item(item: Any, final_state: dict[str, Any]) -> dict[str, An
     return final_state
 
 
-def _retrieve_final_state(app, config: dict, state_in: dict) -> dict[str, Any]:
-    """Retrieve final state with fallbacks."""
-    try:
-        snap = app.get_state(config)
-        return getattr(snap, "values", None) or {}
-    except Exception:
-        pass
-    
-    return app.invoke(state_in, config=config)
+async def _retrieve_final_state(app, config: dict) -> dict[str, Any]:
+    """Read the final state from the checkpointer; never re-runs the graph."""
+    snap = await app.aget_state(config)
+    values = getattr(snap, "values", None)
+    if not values:
+        raise RuntimeError("graph produced no final state and the checkpointer returned none")
+    return values
 
 
-def _execute_with_trace(app, state_in: dict, config: dict, stream_mode: Any) -> dict[str, Any]:
+async def _execute_with_trace(app, state_in: dict, config: dict, stream_mode: Any) -> dict[str, Any]:
     """Execute app with tracing enabled."""
     final_state: dict[str, Any] = {}
     
     console.rule("[bold blue]Execution Trace", align="left", style="blue")
 
-    for item in app.stream(
+    async for item in app.astream(
         state_in,
         config=config,
         stream_mode=stream_mode,
@@ -271,63 +360,87 @@ def _execute_with_trace(app, state_in: dict, config: dict, stream_mode: Any) ->
 
     # Fallbacks for state retrieval
     if not final_state:
-        final_state = _retrieve_final_state(app, config, state_in)
+        final_state = await _retrieve_final_state(app, config)
     
     return final_state
 
 
+# Loop-control defaults sent with every turn
+_BASE_STATE_IN: dict[str, int] = {
+    "iterations": 0,
+    "max_iters": 8,
+    "global_iterations": 0,
+    "max_global_iters": 50,
+}
+
+# One run config per thread, built on the first turn and reused afterwards
+_CONFIG_CACHE: dict[str, dict[str, Any]] = {}
+
+
+def _thread_config(thread_id: str) -> dict[str, Any]:
+    config = _CONFIG_CACHE.get(thread_id)
+    if config is None:
+        config = _CONFIG_CACHE[thread_id] = {
+            "configurable": {"thread_id": thread_id},
+            "recursion_limit": 150,
+        }
+    return config
+
+
 def run_turn(
     app,
     thread_id: str,
     messages: list[BaseMessage],
     trace_level: TraceLevel = "basic",
+    runner: asyncio.Runner | None = None,
 ) -> tuple[dict[str, Any], list[BaseMessage]]:
-    state_in = {
-        "messages": messages, 
-        "iterations": 0, 
-        "max_iters": 8,
-        "global_iterations": 0,
-        "max_global_iters": 50
-    }
+    # The checkpointer owns history for this thread; send only the new message
+    state_in = {"messages": messages[-1:], **_BASE_STATE_IN}
     final_state: dict[str, Any] = {}
-
-    config = {
-        "configurable": {"thread_id": thread_id},
-        "recursion_limit": 150  
-    }
+    config = _thread_config(thread_id)
+    # Pooled async clients (e.g. ChatOllama's) are bound to the loop that opened
+    # them, so a session must run every turn on the same loop.
+    run = runner.run if runner is not None else asyncio.run
 
     if trace_level == "off":
         with console.status("[bold green]Processing...", spinner="dots"):
-            final_state = app.invoke(state_in, config=config)
+            final_state = run(app.ainvoke(state_in, config=config))
     else:
         stream_mode: Any = "updates" if trace_level == "basic" else ["updates", "debug"]
-        final_state = _execute_with_trace(app, state_in, config, stream_mode)
+        final_state = run(_execute_with_trace(app, state_in, config, stream_mode))
 
     # Sync local transcript
     out_msgs: list[BaseMessage] = final_state.get("messages") or []
     if out_msgs:
-        messages[:] = out_msgs
+        messages = out_msgs
 
     return final_state, messages
 
 
+# Accepted `:trace` arguments -> resulting trace level
+_TRACE_ARGS: dict[str, TraceLevel] = {
+    "off": "off", "0": "off", "false": "off",
+    "on": "basic", "1": "basic", "true": "basic", "basic": "basic",
+    "debug": "debug",
+}
+
+
 def _parse_trace_cmd(user_in: str, current: TraceLevel) -> tuple[bool, TraceLevel, str]:
-    parts = user_in.strip().split()
-    if not parts or parts[0] != ":trace":
+    # Cheap prefix test first: ordinary chat input never gets split
+    if not user_in.lstrip().startswith(":trace"):
+        return False, current, ""
+
+    parts = user_in.split()
+    if parts[0] != ":trace":
         return False, current, ""
 
     if len(parts) == 1:
         return True, current, f"Current trace level: [bold]{current}[/bold]"
 
-    arg = parts[1].lower()
-    if arg in ("off", "0", "false"):
-        return True, "off", "Trace level set to [bold]off[/bold]"
-    if arg in ("on", "1", "true", "basic"):
-        return True, "basic", "Trace level set to [bold]basic[/bold]"
-    if arg == "debug":
-        return True, "debug", "Trace level set to [bold]debug[/bold]"
-
-    return True, current, "[danger]Usage:[/danger] :trace off|basic|debug"
+    level = _TRACE_ARGS.get(parts[1].lower())
+    if level is None:
+        return True, current, "[danger]Usage:[/danger] :trace off|basic|debug"
+    return True, level, f"Trace level set to [bold]{level}[/bold]"
 
 
 def _check_health_status() -> None:
@@ -354,11 +467,12 @@ def _run_and_display(
     thread_id: str, 
     messages: list[BaseMessage], 
     trace_level: TraceLevel,
-    user_in: str
+    user_in: str,
+    runner: asyncio.Runner,
 ) -> list[BaseMessage]:
     """Run a single turn of the agent and display the results."""
     messages.append(HumanMessage(content=user_in))
-    final_state, messages = run_turn(app, thread_id, messages, trace_level=trace_level)
+    final_state, messages = run_turn(app, thread_id, messages, trace_level=trace_level, runner=runner)
 
     if trace_level != "off":
         console.rule("[bold blue]End Trace", align="left", style="blue")
@@ -373,17 +487,14 @@ def _run_and_display(
     return messages
 
 
-def main() -> None:
-    _check_health_status()
-
-    app = build_app()
-    thread_id = str(uuid.uuid4())
-
-    _print_welcome_banner()
-
-    messages: list[BaseMessage] = []
-    trace_level: TraceLevel = "basic"
-
+def _repl(
+    app: Any,
+    thread_id: str,
+    messages: list[BaseMessage],
+    trace_level: TraceLevel,
+    runner: asyncio.Runner,
+) -> None:
+    """Read user input and run turns until the user quits."""
     while True:
         try:
             user_in = console.input("[bold green]User[/bold green] > ").strip()
@@ -410,7 +521,23 @@ def main() -> None:
             console.print(f"[info]{msg}[/info]\n")
             continue
 
-        messages = _run_and_display(app, thread_id, messages, trace_level, user_in)
+        messages = _run_and_display(app, thread_id, messages, trace_level, user_in, runner)
+
+
+def main() -> None:
+    _check_health_status()
+
+    app = build_app()
+    thread_id = str(uuid.uuid4())
+
+    _print_welcome_banner()
+
+    messages: list[BaseMessage] = []
+    trace_level: TraceLevel = "basic"
+
+    # One event loop for the whole session; see run_turn
+    with asyncio.Runner() as runner:
+        _repl(app, thread_id, messages, trace_level, runner)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
 from dataclasses import dataclass
 from functools import partial
 from typing import Annotated, Any, Literal, TypedDict
 import re
 
-from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, SystemMessage
+import orjson
+
+from langchain_core.messages import BaseMessage, AIMessage, HumanMessage
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 
-from integrator import GRAMMO_LARK_SPEC
-from generator import grammo_compile, TOOLS as GENERATOR_TOOLS
+from utils import append_or_clear
+from generator import bind_generator_tools, format_compile_errors, lark_and_compile, TOOLS as GENERATOR_TOOLS
 from prompts.debugger_evaluator_prompts import (
     DEBUGGER_EVALUATOR_SYSTEM,
     build_debugger_evaluator_user_payload,
@@ -35,7 +41,7 @@ class DebuggerEvaluatorState(TypedDict, total=False):
 
     compile_attempts: int
     compile_result: dict[str, Any]
-    compile_errors: list[str]
+    compile_errors: Annotated[list[str], append_or_clear]
 
     validated_code: str
     validation_summary: str
@@ -46,6 +52,9 @@ class DebuggerEvaluatorState(TypedDict, total=False):
     max_global_iters: int
     max_iters: int
 
+    memo_key: str
+    memo_hit: bool
+
 
 @dataclass(frozen=True)
 class DebuggerEvaluatorContext:
@@ -56,51 +65,37 @@ def _get_candidate_code(state: DebuggerEvaluatorState) -> str:
     return (state.get("assembled_code") or state.get("code") or "").strip()
 
 
+# Header lines (last occurrence wins), the hallucinated-grammar cut-off, and code fences
+_HEADER_RE = re.compile(r"^[ \t]*(SUMMARY|TESTS|ERRORS):(.*)(?:\n|\Z)", re.MULTILINE)
+_STOP_RE = re.compile(r"^[ \t]*(?:GRAMMO SPECIFICATION:|// ===|start: program)", re.MULTILINE)
+_FENCE_RE = re.compile(r"```(?:\w+)?\s*\n(.*?)\n```", re.DOTALL)
+
+
 def _parse_debugger_evaluator_output(text: str) -> tuple[str, str, str, str]:
     """
     Parses the output to extract Summary, Test Report, Error Report, and Code.
     Returns: (summary, test_summary, error_summary, code)
     """
-    summary = ""
-    test_summary = ""
-    error_summary = ""
-    
-    lines = text.splitlines()
-    clean_lines = []
-    
-    # 1. Extract Headers
-    for line in lines:
-        stripped = line.strip()
-        if stripped.startswith("SUMMARY:"):
-            summary = stripped[len("SUMMARY:") :].strip()
-        elif stripped.startswith("TESTS:"):
-            test_summary = stripped[len("TESTS:") :].strip()
-        elif stripped.startswith("ERRORS:"):
-            error_summary = stripped[len("ERRORS:") :].strip()
-        elif stripped.startswith(("GRAMMO SPECIFICATION:", "// ===", "start: program")):
-            # Stop if we hit hallucinated grammar spec
-            break
-        else:
-            # Keep line if it's not a header
-            clean_lines.append(line)
-
-    text = "\n".join(clean_lines).strip()
-
-    # 2. Extract Code (Handle Markdown Fences)
+    # 1. Stop if we hit hallucinated grammar spec
+    stop = _STOP_RE.search(text)
+    if stop:
+        text = text[: stop.start()]
+
+    # 2. Extract Headers, then drop those lines
+    headers = {k: v.strip() for k, v in _HEADER_RE.findall(text)}
+    text = _HEADER_RE.sub("", text).strip()
+
+    # 3. Extract Code (Handle Markdown Fences)
+    code = text
     if "```" in text:
-        match = re.search(r"```(?:\w+)?\s*\n(.*?)\n```", text, re.DOTALL)
+        match = _FENCE_RE.search(text)
         if match:
             code = match.group(1).strip()
-            return summary, test_summary, error_summary, code
 
-    # 3. Fallback: Return whatever is left after stripping headers
-    # Strip leading empty lines
-    code = text.strip()
-    
-    return summary, test_summary, error_summary, code
+    return headers.get("SUMMARY", ""), headers.get("TESTS", ""), headers.get("ERRORS", ""), code
 
 
-def debugger_evaluator_generate(ctx: DebuggerEvaluatorContext, state: DebuggerEvaluatorState) -> dict:
+async def debugger_evaluator_generate(ctx: DebuggerEvaluatorContext, state: DebuggerEvaluatorState) -> dict:
     code = _get_candidate_code(state)
     task = (state.get("task") or state.get("original_task") or "").strip()
     test_result = state.get("test_result") or {}
@@ -109,23 +104,18 @@ def debugger_evaluator_generate(ctx: DebuggerEvaluatorContext, state: DebuggerEv
 
     user_payload = build_debugger_evaluator_user_payload(task, test_result, code)
 
-    msgs = state.get("messages", [])
-    if not any(isinstance(m, SystemMessage) for m in msgs):
-        msgs = [DEBUGGER_EVALUATOR_SYSTEM, *msgs]
-    else:
-        msgs = msgs[:]
+    # Built in one allocation; the system prompt and payload are sent to the model, never stored
+    msgs = [DEBUGGER_EVALUATOR_SYSTEM, *state.get("messages", []), HumanMessage(content=user_payload)]
 
-    msgs.append(HumanMessage(content=user_payload))
-
-    ai: AIMessage = ctx.llm_with_tools.invoke(msgs)
+    ai: AIMessage = await ctx.llm_with_tools.ainvoke(msgs)
 
     # Simple text extraction from content
     raw_content = ai.content
-    content = ""
     if isinstance(raw_content, list):
-        for item in raw_content:
-            if isinstance(item, str): content += item
-            elif isinstance(item, dict): content += item.get("text", "")
+        content = "".join(
+            item if isinstance(item, str) else item.get("text", "") if isinstance(item, dict) else ""
+            for item in raw_content
+        )
     else:
         content = (raw_content or "").strip()
     
@@ -145,32 +135,30 @@ def debugger_evaluator_route_after_generate(state: DebuggerEvaluatorState) -> Li
         return "__end__"
     
     last = msgs[-1]
-    if getattr(last, "tool_calls", None):
+    if isinstance(last, AIMessage) and last.tool_calls:
         return "tools"
     
     return "compile"
 
 
-def debugger_evaluator_compile(state: DebuggerEvaluatorState) -> dict:
+async def debugger_evaluator_compile(state: DebuggerEvaluatorState) -> dict:
     full_text = (state.get("validated_code") or "").strip()
     
     # Strip headers (SUMMARY / TESTS / ERRORS) before compiling
     _, _, _, code_only = _parse_debugger_evaluator_output(full_text)
 
-    result = grammo_compile.invoke({"code": code_only})
+    syntax, result = await lark_and_compile(code_only)
     attempts = int(state.get("compile_attempts", 0)) + 1
     compiled = bool(result.get("compiled", False))
-    errors = (result.get("errors") or "").strip()
-
-    compile_errors = list(state.get("compile_errors", []))
-    if (not compiled) and errors:
-        compile_errors.append(errors)
+    errors = format_compile_errors(syntax, result)
 
     out: dict[str, Any] = {
         "compile_attempts": attempts,
         "compile_result": result,
-        "compile_errors": compile_errors,
     }
+    if (not compiled) and errors:
+        # Delta only; the append_or_clear reducer accumulates it
+        out["compile_errors"] = [errors]
 
     if (not compiled) and attempts < 5:
         out["messages"] = [
@@ -201,6 +189,7 @@ def debugger_evaluator_finalize(state: DebuggerEvaluatorState) -> dict:
     
     # Parse all fields
     summary, test_summary, error_summary, code = _parse_debugger_evaluator_output(full_text)
+    _memo_store(state, full_text)
 
     # Fallback: If error_summary is empty but we have compile errors in history, use them
     if not error_summary and state.get("compile_errors"):
@@ -216,6 +205,60 @@ def debugger_evaluator_finalize(state: DebuggerEvaluatorState) -> dict:
     }
 
 
+# Opt-in persistent memo of successful runs: (task, code, test results) -> final output
+_MEMO_DB = os.getenv("DEBUGGER_MEMO_DB")
+
+
+def _memo_key(state: DebuggerEvaluatorState) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update((state.get("task") or state.get("original_task") or "").strip().encode())
+    h.update(b"\0")
+    h.update(_get_candidate_code(state).encode())
+    h.update(b"\0")
+    h.update(orjson.dumps(state.get("test_result") or {}, default=str, option=orjson.OPT_SORT_KEYS))
+    return h.hexdigest()
+
+
+def _memo_connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(_MEMO_DB)
+    conn.execute("CREATE TABLE IF NOT EXISTS debugger_memo (key TEXT PRIMARY KEY, validated_code TEXT NOT NULL)")
+    return conn
+
+
+def debugger_evaluator_lookup(state: DebuggerEvaluatorState) -> dict:
+    if not _MEMO_DB:
+        return {"memo_hit": False}
+
+    key = _memo_key(state)
+    with closing(_memo_connect()) as conn:
+        row = conn.execute("SELECT validated_code FROM debugger_memo WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return {"memo_key": key, "memo_hit": False}
+
+    return {
+        "memo_key": key,
+        "memo_hit": True,
+        "validated_code": row[0],
+        "compile_result": {"compiled": True, "info": "", "warning": "", "errors": ""},
+    }
+
+
+def debugger_evaluator_route_after_lookup(state: DebuggerEvaluatorState) -> Literal["generate", "finalize"]:
+    return "finalize" if state.get("memo_hit") else "generate"
+
+
+def _memo_store(state: DebuggerEvaluatorState, validated_code: str) -> None:
+    if not _MEMO_DB or state.get("memo_hit") or not state.get("memo_key"):
+        return
+    if not (state.get("compile_result") or {}).get("compiled"):
+        return
+    with closing(_memo_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO debugger_memo (key, validated_code) VALUES (?, ?)",
+            (state["memo_key"], validated_code),
+        )
+
+
 def reset_iterations(state: DebuggerEvaluatorState) -> dict:
     current_iters = int(state.get("iteration_count", 0))
     global_iters = int(state.get("global_iterations", 0))
@@ -235,17 +278,23 @@ def reset_iterations(state: DebuggerEvaluatorState) -> dict:
 
 
 def build_debugger_evaluator_subgraph(llm):
-    ctx = DebuggerEvaluatorContext(llm_with_tools=llm.bind_tools(GENERATOR_TOOLS))
+    ctx = DebuggerEvaluatorContext(llm_with_tools=bind_generator_tools(llm))
 
     g = StateGraph(DebuggerEvaluatorState)
     g.add_node("reset", reset_iterations)
+    g.add_node("lookup", debugger_evaluator_lookup)
     g.add_node("generate", partial(debugger_evaluator_generate, ctx))
     g.add_node("tools", ToolNode(GENERATOR_TOOLS))
     g.add_node("compile", debugger_evaluator_compile)
     g.add_node("finalize", debugger_evaluator_finalize)
 
     g.add_edge(START, "reset")
-    g.add_edge("reset", "generate")
+    g.add_edge("reset", "lookup")
+    g.add_conditional_edges(
+        "lookup",
+        debugger_evaluator_route_after_lookup,
+        {"generate": "generate", "finalize": "finalize"},
+    )
     g.add_conditional_edges(
         "generate",
         debugger_evaluator_route_after_generate,
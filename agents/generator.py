@@ -1,19 +1,25 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 from functools import partial
 from typing import Annotated, Literal, TypedDict, Any
 
+import orjson
 from pydantic import BaseModel, Field
-from langchain.tools import tool
-from langchain_core.messages import BaseMessage, AIMessage, SystemMessage, HumanMessage
+from langchain_core.tools import StructuredTool
+from langchain_core.messages import BaseMessage, AIMessage, HumanMessage
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 
-from mcp_client import grammo_compiler_mcp, grammo_lark_mcp
+from mcp_client import grammo_compiler_mcp, grammo_lark_compile_mcp, grammo_lark_mcp
 from prompts.generator_prompts import GRAMMO_SYSTEM, build_generator_compile_failure_message
-from utils import sanitize_grammo_source, run_async_in_sync
+from utils import append_or_clear, cache_per_llm, sanitize_grammo_source, run_async_in_sync, run_on_background_loop
 import re
 
 # ==========================================
@@ -36,22 +42,62 @@ class GrammoCode(BaseModel):
 # 3. Tools
 # ==========================================
 
-@tool("grammo_lark", args_schema=GrammoCode)
-def grammo_lark(code: str) -> str:
+# Checking and compiling are deterministic, so results are reused per (check, source digest)
+_MCP_CACHE: OrderedDict[tuple[str, str], dict[str, Any]] = OrderedDict()
+_MCP_CACHE_MAX = 256
+_MCP_CACHE_LOCK = threading.Lock()
+
+
+def _digest(code: str) -> str:
+    return hashlib.blake2b(code.encode(), digest_size=16).hexdigest()
+
+
+def _cache_get(kind: str, digest: str) -> dict[str, Any] | None:
+    with _MCP_CACHE_LOCK:
+        hit = _MCP_CACHE.get((kind, digest))
+        if hit is not None:
+            _MCP_CACHE.move_to_end((kind, digest))
+        return hit
+
+
+def _cache_put(kind: str, digest: str, result: Any) -> Any:
+    # Only real result dicts are kept; transport-level failures are retried
+    if isinstance(result, dict):
+        with _MCP_CACHE_LOCK:
+            _MCP_CACHE[(kind, digest)] = result
+            if len(_MCP_CACHE) > _MCP_CACHE_MAX:
+                _MCP_CACHE.popitem(last=False)
+    return result
+
+
+def _grammo_lark(code: str) -> str:
     """
     Check the given source string with the Lark syntax checker.
     """
-    result = run_async_in_sync(grammo_lark_mcp(code))
+    digest = _digest(code)
+    result = _cache_get("lark", digest)
+    if result is None:
+        result = _cache_put("lark", digest, run_async_in_sync(grammo_lark_mcp(code)))
     return f"Lark syntax check result: {result}"
 
 
-@tool("grammo_compile", args_schema=GrammoCode)
-def grammo_compile(code: str) -> dict[str, str]:
-    """
-    Compile a source string into Grammo format.
-    """
-    result = run_async_in_sync(grammo_compiler_mcp(code))
+async def _agrammo_lark(code: str) -> str:
+    digest = _digest(code)
+    result = _cache_get("lark", digest)
+    if result is None:
+        result = _cache_put("lark", digest, await run_on_background_loop(grammo_lark_mcp(code)))
+    return f"Lark syntax check result: {result}"
+
+
+grammo_lark = StructuredTool.from_function(
+    func=_grammo_lark,
+    coroutine=_agrammo_lark,
+    name="grammo_lark",
+    args_schema=GrammoCode,
+)
 
+
+def _stable_compile_result(result: Any) -> dict[str, str]:
     # Ensure a stable dict shape even if upstream returns weird types
     if not isinstance(result, dict):
         return {"compiled": False, "info": "", "warning": "", "errors": str(result)}
@@ -63,10 +109,91 @@ def grammo_compile(code: str) -> dict[str, str]:
         "errors": str(result.get("errors", "") or ""),
     }
 
-    
+
+def compile_grammo(code: str) -> dict[str, str]:
+    """
+    Compile a source string into Grammo format.
+    """
+    digest = _digest(code)
+    result = _cache_get("compile", digest)
+    if result is None:
+        result = _cache_put("compile", digest, run_async_in_sync(grammo_compiler_mcp(code)))
+    return _stable_compile_result(result)
+
+
+async def acompile_grammo(code: str) -> dict[str, str]:
+    digest = _digest(code)
+    result = _cache_get("compile", digest)
+    if result is None:
+        result = _cache_put("compile", digest, await run_on_background_loop(grammo_compiler_mcp(code)))
+    return _stable_compile_result(result)
+
+
+def _grammo_compile(code: str) -> str:
+    return orjson.dumps(compile_grammo(code)).decode()
+
+
+async def _agrammo_compile(code: str) -> str:
+    return orjson.dumps(await acompile_grammo(code)).decode()
+
+
+# LLM-facing wrapper; internal callers use compile_grammo / acompile_grammo directly.
+# Returning pre-encoded JSON keeps ToolNode off its stdlib json.dumps path.
+grammo_compile = StructuredTool.from_function(
+    func=_grammo_compile,
+    coroutine=_agrammo_compile,
+    description=compile_grammo.__doc__,
+    name="grammo_compile",
+    args_schema=GrammoCode,
+)
+
+
+async def lark_and_compile(code: str) -> tuple[dict[str, Any], dict[str, str]]:
+    """Syntax-check and compile `code`, running both MCP calls concurrently."""
+    digest = _digest(code)
+    syntax = _cache_get("lark", digest)
+    compiled = _cache_get("compile", digest)
+
+    if syntax is None and compiled is None:
+        syntax, compiled = await run_on_background_loop(grammo_lark_compile_mcp(code))
+    elif syntax is None:
+        syntax = await run_on_background_loop(grammo_lark_mcp(code))
+    elif compiled is None:
+        compiled = await run_on_background_loop(grammo_compiler_mcp(code))
+
+    _cache_put("lark", digest, syntax)
+    _cache_put("compile", digest, compiled)
+    return (syntax if isinstance(syntax, dict) else {}), _stable_compile_result(compiled)
+
+
+def format_compile_errors(syntax: dict[str, Any], result: dict[str, str]) -> str:
+    """Compiler errors, plus the Lark parse failure when the syntax check rejected the code."""
+    errors = (result.get("errors") or "").strip()
+    if not result.get("compiled") and syntax.get("is_valid") is False and syntax.get("message"):
+        # Point the model at the exact parse failure, not just the compiler output
+        errors = f"{errors}\nSyntax check: {syntax['message']}".strip()
+    return errors
+
+
+async def check_candidates(code: str, candidates: list[str]) -> tuple[str, dict[str, Any], dict[str, str]]:
+    """Validate `candidates` concurrently; return (source, syntax, result) for the
+    first that compiles, falling back to `code` when none does."""
+    checks = await asyncio.gather(*(lark_and_compile(c) for c in candidates))
+    for candidate, (syntax, result) in zip(candidates, checks):
+        if result.get("compiled"):
+            return candidate, syntax, result
+    # Cached by now when `code` is one of the candidates
+    syntax, result = await lark_and_compile(code)
+    return code, syntax, result
+
 
 TOOLS = [grammo_lark, grammo_compile]
 
+@cache_per_llm
+def bind_generator_tools(llm):
+    """Return `llm.bind_tools(TOOLS)`, building the tool schemas once per model."""
+    return llm.bind_tools(TOOLS)
+
 
 # ==========================================
 # 4. State & Prompts
@@ -80,27 +207,64 @@ class GeneratorState(TypedDict, total=False):
     code: str
     compile_attempts: int
     compile_result: dict[str, Any]
-    compile_errors: list[str]
+    compile_errors: Annotated[list[str], append_or_clear]
+    syntax_result: dict[str, Any]
+    has_tool_calls: bool
+    candidates: list[str]
+
+
+# Candidates sampled on the first attempt (k× token spend); 1 keeps the single-shot loop
+GENERATOR_CANDIDATES = max(1, int(os.getenv("GENERATOR_CANDIDATES", "1")))
+# The models are built with temperature=0; extra candidates sample at this one to differ
+GENERATOR_CANDIDATE_TEMPERATURE = float(os.getenv("GENERATOR_CANDIDATE_TEMPERATURE", "0.7"))
 
 
 @dataclass(frozen=True)
 class GeneratorContext:
     llm_with_tools: object
+    # Tool-bound copy sampling at GENERATOR_CANDIDATE_TEMPERATURE; set when GENERATOR_CANDIDATES > 1
+    sampler: object = None
+
 
+def _with_temperature(llm, temperature: float):
+    # Chat models are pydantic; _GeminiSafeWrapper copies its wrapped model
+    if hasattr(type(llm), "model_copy"):
+        return llm.model_copy(update={"temperature": temperature})
+    return llm.with_temperature(temperature)
 
-def ensure_system_message(messages: list[BaseMessage]) -> list[BaseMessage]:
-    if messages and isinstance(messages[0], SystemMessage):
-        return messages
-    return [GRAMMO_SYSTEM, *messages]
 
+def _snap(state: GeneratorState) -> tuple[int, int, int]:
+    """(iterations, max_iters, compile_attempts), read once per node."""
+    return (
+        int(state.get("iterations", 0)),
+        int(state.get("max_iters", 5)),
+        int(state.get("compile_attempts", 0)),
+    )
 
-def generator_generate(ctx: GeneratorContext, state: GeneratorState) -> dict:
-    messages = ensure_system_message(state.get("messages", []))
-    ai: AIMessage = ctx.llm_with_tools.invoke(messages)
 
-    iters = int(state.get("iterations", 0)) + 1
-    max_iters = int(state.get("max_iters", 5))
+async def generator_generate(ctx: GeneratorContext, state: GeneratorState) -> dict:
+    iters, max_iters, _ = _snap(state)
+    # System prompts are never written to state, so the prefix is always prepended here
+    msgs = [GRAMMO_SYSTEM, *state.get("messages", [])]
 
+    candidates: list[str] = []
+    if iters == 0 and ctx.sampler is not None:
+        # The greedy reply plus k-1 sampled ones, so the batch never does worse than k=1
+        greedy, sampled = await asyncio.gather(
+            ctx.llm_with_tools.ainvoke(msgs),
+            ctx.sampler.abatch([msgs] * (GENERATOR_CANDIDATES - 1)),
+        )
+        ais: list[AIMessage] = [greedy, *sampled]
+        # Keep one reply in history; prefer one that carries source over a tool call
+        ai = next((a for a in ais if not a.tool_calls), ais[0])
+        if not ai.tool_calls:
+            candidates = list(dict.fromkeys(
+                c for a in ais if not a.tool_calls and (c := sanitize_grammo_source(a.content or ""))
+            ))
+    else:
+        ai = await ctx.llm_with_tools.ainvoke(msgs)
+
+    iters += 1
     code = sanitize_grammo_source(ai.content or "")
     
     # If code is empty and no tool calls, try to recover by asking explicitly next time
@@ -112,62 +276,63 @@ def generator_generate(ctx: GeneratorContext, state: GeneratorState) -> dict:
         "iterations": iters,
         "max_iters": max_iters,
         "code": code,
+        "has_tool_calls": bool(ai.tool_calls),
+        "candidates": candidates,
     }
 
 
 def generator_route_after_generate(state: GeneratorState) -> Literal["tools", "compile", "__end__"]:
-    iters = int(state.get("iterations", 0))
-    max_iters = int(state.get("max_iters", 5))
+    iters, max_iters, _ = _snap(state)
     if iters >= max_iters:
         return "__end__"
 
-    msgs = state.get("messages", [])
-    if not msgs:
-        return "__end__"
-
-    last = msgs[-1]
-    if getattr(last, "tool_calls", None):
-        return "tools"
-
-    return "compile"
+    # Set by generator_generate, the only node that routes through here
+    return "tools" if state.get("has_tool_calls") else "compile"
 
 
-def generator_compile(state: GeneratorState) -> dict:
-    code = sanitize_grammo_source(state.get("code") or "")
+async def generator_compile(state: GeneratorState) -> dict:
+    # generator_generate is the single sanitizing entry point; the sanitizer is idempotent.
+    code = state.get("code") or ""
+    _, max_retries, attempts = _snap(state)
+    attempts += 1
 
     # Safety check: If code is empty, don't even try to compile, just fail.
     if not code or len(code.strip()) < 10:
-        attempts = int(state.get("compile_attempts", 0)) + 1
         return {
             "compile_attempts": attempts,
             "compile_result": {"compiled": False, "errors": "No code generated or code too short."},
-            "compile_errors": list(state.get("compile_errors", [])) + ["No code generated."],
+            "compile_errors": ["No code generated."],
             "code": code,
             "messages": [
                 HumanMessage(content="Error: No code found. Please output the full Grammo code.")
             ]
         }
 
-    result = grammo_compile.invoke({"code": code})
+    out: dict[str, Any] = {}
+    candidates = state.get("candidates") or []
+    if len(candidates) > 1:
+        chosen, syntax, result = await check_candidates(code, candidates)
+        if chosen != code:
+            code = chosen
+            # Swap the winning source into the reply generate just recorded
+            last = state["messages"][-1]
+            out["messages"] = [last.model_copy(update={"content": code})]
+    else:
+        syntax, result = await lark_and_compile(code)
 
-    attempts = int(state.get("compile_attempts", 0)) + 1
     compiled = bool(result.get("compiled", False))
-    errors = (result.get("errors") or "").strip()
-
-    compile_errors = list(state.get("compile_errors", []))
-    if (not compiled) and errors:
-        compile_errors.append(errors)
+    errors = format_compile_errors(syntax, result)
 
-    out: dict[str, Any] = {
+    out.update({
         "compile_attempts": attempts,
         "compile_result": result,
-        "compile_errors": compile_errors,
+        "syntax_result": syntax,
         "code": code
-    }
+    })
+    if (not compiled) and errors:
+        # Delta only; the append_or_clear reducer accumulates it
+        out["compile_errors"] = [errors]
 
-    # Use max_iters from state or default to 5
-    max_retries = int(state.get("max_iters", 5))
-    
     if (not compiled) and attempts < max_retries:
         out["messages"] = [
             HumanMessage(
@@ -181,8 +346,7 @@ def generator_compile(state: GeneratorState) -> dict:
 def generator_route_after_compile(state: GeneratorState) -> Literal["generate", "__end__"]:
     result = state.get("compile_result") or {}
     compiled = bool(result.get("compiled", False))
-    attempts = int(state.get("compile_attempts", 0))
-    max_retries = int(state.get("max_iters", 5))
+    _, max_retries, attempts = _snap(state)
 
     if compiled:
         return "__end__"
@@ -215,8 +379,12 @@ def reset_iterations(state: GeneratorState) -> dict:
     }
 
 
+@cache_per_llm
 def build_generator_subgraph(llm):
-    ctx = GeneratorContext(llm_with_tools=llm.bind_tools(TOOLS))
+    sampler = None
+    if GENERATOR_CANDIDATES > 1:
+        sampler = _with_temperature(llm, GENERATOR_CANDIDATE_TEMPERATURE).bind_tools(TOOLS)
+    ctx = GeneratorContext(llm_with_tools=bind_generator_tools(llm), sampler=sampler)
 
     g = StateGraph(GeneratorState)
     g.add_node("reset", reset_iterations)
@@ -1,17 +1,30 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import hashlib
+import os
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing
+from dataclasses import dataclass, field
 from functools import partial
 from typing import Annotated, Any, Literal, TypedDict
 import re
-from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, SystemMessage
+import orjson
+from langchain_core.messages import (
+    BaseMessage,
+    AIMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    message_chunk_to_message,
+)
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 
-from generator import grammo_compile, TOOLS as GENERATOR_TOOLS
-from prompts.integrator_prompts import INTEGRATOR_SYSTEM, build_integrator_compile_failure_message, GRAMMO_LARK_SPEC
-from utils import sanitize_grammo_source
+from generator import bind_generator_tools, check_candidates, format_compile_errors, lark_and_compile, TOOLS as GENERATOR_TOOLS
+from prompts.integrator_prompts import INTEGRATOR_SYSTEM, build_integrator_compile_failure_message
+from utils import append_or_clear, cache_per_llm, is_retryable_error, sanitize_grammo_source
 
 
 class IntegratorState(TypedDict, total=False):
@@ -29,12 +42,67 @@ class IntegratorState(TypedDict, total=False):
 
     compile_attempts: int
     compile_result: dict[str, Any]
-    compile_errors: list[str]
+    compile_errors: Annotated[list[str], append_or_clear]
+    syntax_result: dict[str, Any]
+    has_tool_calls: bool
+    candidates: list[str]
+
+
+# Alternative fixes requested per repair turn; 1 keeps the single-patch prompt
+INTEGRATOR_FIX_CANDIDATES = max(1, int(os.getenv("INTEGRATOR_FIX_CANDIDATES", "1")))
+_FIX_RE = re.compile(r"^[ \t]*\[\[FIX \d+\]\][ \t]*$", re.MULTILINE)
+_CODE_START_RE = re.compile(r"^[ \t]*(?:func|var)", re.MULTILINE)
+# Trailers the integrator prompt forbids; nothing after them is source
+_TRAILER_RE = re.compile(r"^[ \t]*(?:\*\*)?(?:SUMMARY|SAFETY|EXPLANATION|NOTES)\b", re.MULTILINE)
+
+
+_REPLY_CACHE_MAX = 64
 
 
 @dataclass(frozen=True)
 class IntegratorContext:
     llm_with_tools: object
+    # Replies already produced by this model, keyed by _reply_key
+    replies: OrderedDict[bytes, AIMessage] = field(default_factory=OrderedDict)
+
+
+def _reply_key(task: str, messages: list[BaseMessage]) -> bytes:
+    # Namespaced by task so identical follow-ups in different tasks never collide
+    payload = orjson.dumps(
+        [task, [(m.type, m.content, getattr(m, "tool_calls", None) or None) for m in messages]],
+        default=str,
+    )
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def _reply_end(text: str) -> int | None:
+    """Offset where a reply's program ends: just past its closing fence, or at a
+    forbidden trailer after the code. None while the program may still continue."""
+    start = _CODE_START_RE.search(text)
+    if start is None or "[[FIX" in text:
+        return None
+    if "```" in text[:start.start()]:
+        close = text.find("```", start.end())
+        if close != -1:
+            return close + 3
+    trailer = _TRAILER_RE.search(text, start.end())
+    return trailer.start() if trailer is not None else None
+
+
+# Id prefix marking the compile-failure feedback integrator_compile posts
+_FEEDBACK_ID = "integrator-feedback-"
+
+
+def _superseded_round(messages: list[BaseMessage]) -> list[RemoveMessage]:
+    """Removals for the previous failed attempt and its feedback, now replaced by the latest attempt."""
+    for i in range(len(messages) - 1, 0, -1):
+        msg = messages[i]
+        if msg.id and msg.id.startswith(_FEEDBACK_ID):
+            prev = messages[i - 1]
+            if isinstance(prev, AIMessage) and not prev.tool_calls:
+                return [RemoveMessage(id=prev.id), RemoveMessage(id=msg.id)]
+            return [RemoveMessage(id=msg.id)]
+    return []
 
 
 def ensure_system(messages: list[BaseMessage]) -> list[BaseMessage]:
@@ -43,13 +111,60 @@ def ensure_system(messages: list[BaseMessage]) -> list[BaseMessage]:
     return [INTEGRATOR_SYSTEM, *messages]
 
 
-def integrator_generate(ctx: IntegratorContext, state: IntegratorState) -> dict:
-    msgs = ensure_system(state.get("messages", []))
-    ai: AIMessage = ctx.llm_with_tools.invoke(msgs)
-
-    iters = int(state.get("iterations", 0)) + 1
-    max_iters = int(state.get("max_iters", 5))
-    code = sanitize_grammo_source(ai.content or "")
+async def integrator_generate(ctx: IntegratorContext, state: IntegratorState) -> dict:
+    get = state.get
+    msgs = ensure_system(get("messages", []))
+
+    key = _reply_key(get("task") or "", msgs)
+    cached = ctx.replies.get(key)
+    if cached is not None:
+        ctx.replies.move_to_end(key)
+        # Fresh id, so add_messages appends it instead of replacing an earlier reply
+        ai: AIMessage = cached.model_copy(update={"id": None})
+    else:
+        # Stream so decoding stops once the program is complete
+        acc = None
+        try:
+            async with aclosing(ctx.llm_with_tools.astream(msgs)) as stream:
+                async for chunk in stream:
+                    acc = chunk if acc is None else acc + chunk
+                    if (
+                        "`" in chunk.text or ":" in chunk.text
+                    ) and not acc.tool_call_chunks and isinstance(acc.content, str) and _reply_end(acc.content) is not None:
+                        break
+            ai = message_chunk_to_message(acc) if acc is not None else AIMessage(content="")
+        except Exception as e:
+            # A started stream is never replayed (its chunks are already in acc),
+            # so a rate limit mid-reply falls back to one retrying full call
+            if acc is None or not is_retryable_error(e):
+                raise
+            ai = await ctx.llm_with_tools.ainvoke(msgs)
+
+        # The sanitizer only strips fences and leading prose, so drop the
+        # (possibly partial) trailer here, before code, history and cache see it
+        if not ai.tool_calls and isinstance(ai.content, str):
+            end = _reply_end(ai.content)
+            if end is not None:
+                ai = ai.model_copy(update={"content": ai.content[:end].rstrip()})
+
+        # Tool-call ids must stay unique in history, so only plain replies are reused
+        if not ai.tool_calls and ai.content:
+            ctx.replies[key] = ai
+            if len(ctx.replies) > _REPLY_CACHE_MAX:
+                ctx.replies.popitem(last=False)
+
+    iters = int(get("iterations", 0)) + 1
+    max_iters = int(get("max_iters", 5))
+    content = ai.content or ""
+
+    candidates: list[str] = []
+    if isinstance(content, str) and "[[FIX" in content:
+        # Batched repair reply: one program per [[FIX n]] block. Blocks without a
+        # declaration (e.g. prose before [[FIX 1]]) are not programs.
+        candidates = list(dict.fromkeys(
+            sanitize_grammo_source(part) for part in _FIX_RE.split(content) if _CODE_START_RE.search(part)
+        ))
+    code = candidates[0] if candidates else sanitize_grammo_source(content)
 
     return {
         "messages": [ai],
@@ -57,57 +172,71 @@ def integrator_generate(ctx: IntegratorContext, state: IntegratorState) -> dict:
         "max_iters": max_iters,
         "assembled_code": code,
         "code": code,
+        "has_tool_calls": bool(getattr(ai, "tool_calls", None)),
+        "candidates": candidates,
     }
 
 
 def integrator_route_after_generate(state: IntegratorState) -> Literal["tools", "compile", "__end__"]:
-    iters = int(state.get("iterations", 0))
-    max_iters = int(state.get("max_iters", 5))
-    if iters >= max_iters:
-        return "__end__"
-
-    msgs = state.get("messages", [])
-    if not msgs:
+    get = state.get
+    if int(get("iterations", 0)) >= int(get("max_iters", 5)):
         return "__end__"
 
-    last = msgs[-1]
-    if getattr(last, "tool_calls", None):
-        return "tools"
-    return "compile"
-
-
-def integrator_compile(state: IntegratorState) -> dict:
-    code = sanitize_grammo_source(state.get("assembled_code") or state.get("code") or "")
-    result = grammo_compile.invoke({"code": code})
-
-    attempts = int(state.get("compile_attempts", 0)) + 1
+    return "tools" if get("has_tool_calls") else "compile"
+
+
+async def integrator_compile(state: IntegratorState) -> dict:
+    get = state.get
+    # integrator_generate, the only way into this node, already sanitized it
+    code = get("assembled_code") or get("code") or ""
+    out: dict[str, Any] = {}
+
+    candidates = get("candidates") or []
+    if len(candidates) > 1:
+        chosen, syntax, result = await check_candidates(code, candidates)
+        if chosen != code:
+            code = chosen
+            out["assembled_code"] = out["code"] = code
+        if result.get("compiled"):
+            # Keep only the winning fix in history
+            last = state["messages"][-1]
+            out["messages"] = [last.model_copy(update={"content": code})]
+    else:
+        syntax, result = await lark_and_compile(code)
+
+    attempts = int(get("compile_attempts", 0)) + 1
     compiled = bool(result.get("compiled", False))
-    errors = (result.get("errors") or "").strip()
-
-    compile_errors = list(state.get("compile_errors", []))
-    if (not compiled) and errors:
-        compile_errors.append(errors)
+    errors = format_compile_errors(syntax, result)
 
-    out: dict[str, Any] = {
+    out.update({
         "compile_attempts": attempts,
         "compile_result": result,
-        "compile_errors": compile_errors,
-    }
+        "syntax_result": syntax,
+    })
+    if (not compiled) and errors:
+        # Delta only; the append_or_clear reducer accumulates it
+        out["compile_errors"] = [errors]
 
     if (not compiled) and attempts < 3:
+        # Only the latest attempt and its errors are worth re-sending; earlier
+        # rounds of this run (attempts > 1) are dropped from the history.
+        removals = _superseded_round(get("messages", [])) if attempts > 1 else []
         out["messages"] = [
+            *removals,
             HumanMessage(
-                content=build_integrator_compile_failure_message(errors)
-            )
+                content=build_integrator_compile_failure_message(errors, INTEGRATOR_FIX_CANDIDATES),
+                id=f"{_FEEDBACK_ID}{uuid.uuid4().hex}",
+            ),
         ]
 
     return out
 
 
 def integrator_route_after_compile(state: IntegratorState) -> Literal["generate", "__end__"]:
-    result = state.get("compile_result") or {}
+    get = state.get
+    result = get("compile_result") or {}
     compiled = bool(result.get("compiled", False))
-    attempts = int(state.get("compile_attempts", 0))
+    attempts = int(get("compile_attempts", 0))
 
     if compiled or attempts >= 3:
         return "__end__"
@@ -115,11 +244,10 @@ def integrator_route_after_compile(state: IntegratorState) -> Literal["generate"
 
 
 def reset_iterations(state: IntegratorState) -> dict:
-    current_iters = int(state.get("iterations", 0))
-    global_iters = int(state.get("global_iterations", 0))
-    new_global = global_iters + current_iters
+    get = state.get
+    new_global = int(get("global_iterations", 0)) + int(get("iterations", 0))
     
-    if new_global > int(state.get("max_global_iters", 30)):
+    if new_global > int(get("max_global_iters", 30)):
         return {
             "iterations": 0, 
             "global_iterations": new_global, 
@@ -136,8 +264,9 @@ def reset_iterations(state: IntegratorState) -> dict:
     }
 
 
+@cache_per_llm
 def build_integrator_subgraph(llm):
-    ctx = IntegratorContext(llm_with_tools=llm.bind_tools(GENERATOR_TOOLS))
+    ctx = IntegratorContext(llm_with_tools=bind_generator_tools(llm))
 
     g = StateGraph(IntegratorState)
     g.add_node("reset", reset_iterations)
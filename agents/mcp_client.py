@@ -1,12 +1,27 @@
 from __future__ import annotations
 
-import json
+import atexit
+import asyncio
+import orjson
 from typing import Any, TypedDict, Optional, List
 
 from fastmcp import Client
 
+try:
+    from mcp.types import TextContent
+except ImportError:  # the local mcp/ server folder can shadow the SDK package
+    TextContent = None
+
+from utils import get_background_loop
+
 MCP_URL = "http://127.0.0.1:8000/mcp"
 
+# Long-lived MCP session shared by all tool calls. A FastMCP client is bound to
+# the event loop that opened it, so it is re-created if the loop changes.
+_client: Optional[Client] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_client_lock: Optional[asyncio.Lock] = None
+
 
 class SyntaxCheckResult(TypedDict):
     is_valid: bool
@@ -58,30 +73,39 @@ def _try_direct_attributes(raw: Any) -> Any:
 
 def _extract_text_parts(content: Any) -> list[str]:
     """Extract text parts from content list."""
-    texts: list[str] = []
     try:
-        for part in content:
-            if part is None:
-                continue
-            if isinstance(part, str):
-                texts.append(part)
-                continue
+        parts = iter(content)
+    except TypeError:
+        return []
 
+    texts: list[str] = []
+    for part in parts:
+        # Common case: a single TextContent part holding the JSON payload
+        if TextContent is not None and type(part) is TextContent:
+            texts.append(part.text)
+            continue
+        if part is None:
+            continue
+        if isinstance(part, str):
+            texts.append(part)
+            continue
+
+        try:
             t = getattr(part, "text", None)
             if t is None and isinstance(part, dict):
                 t = part.get("text")
-            if isinstance(t, str) and t.strip():
-                texts.append(t)
-    except Exception:
-        pass
+        except Exception:
+            continue
+        if isinstance(t, str) and t.strip():
+            texts.append(t)
     return texts
 
 
 def _parse_json_or_string(merged: str) -> Any:
     """Try JSON parsing, fallback to plain string."""
     try:
-        return json.loads(merged)
-    except Exception:
+        return orjson.loads(merged)
+    except orjson.JSONDecodeError:
         return merged
 
 
@@ -128,19 +152,73 @@ def _normalize_tool_result(raw: Any) -> Any:
     return _parse_json_or_string(merged)
 
 
+async def _get_client() -> Client:
+    """Return the shared, connected MCP client for the running event loop."""
+    global _client, _client_loop, _client_lock
+
+    loop = asyncio.get_running_loop()
+    if _client_loop is not loop:
+        _client, _client_loop, _client_lock = None, loop, asyncio.Lock()
+
+    if _client is None or not _client.is_connected():
+        async with _client_lock:
+            if _client is None or not _client.is_connected():
+                client = Client(MCP_URL)
+                await client.__aenter__()
+                _client = client
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared MCP session (call from the loop that owns it)."""
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.__aexit__(None, None, None)
+
+
+def _close_client_at_exit() -> None:
+    """Close the shared MCP session on the background loop before the interpreter exits."""
+    if _client is None:
+        return
+    loop = get_background_loop()
+    if _client_loop is not loop or loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(close_client(), loop).result(timeout=5)
+    except Exception:
+        pass  # the server may already be gone; nothing left to release
+
+
+atexit.register(_close_client_at_exit)
+
+
 async def grammo_lark_mcp(code: str) -> SyntaxCheckResult:
-    async with Client(MCP_URL) as client:
-        raw = await client.call_tool("grammo_lark", {"code": code})
-        return _normalize_tool_result(raw)
+    client = await _get_client()
+    raw = await client.call_tool("grammo_lark", {"code": code})
+    return _normalize_tool_result(raw)
 
 
 async def grammo_compiler_mcp(code: str) -> CompilationResult:
-    async with Client(MCP_URL) as client:
-        raw = await client.call_tool("grammo_compiler", {"code": code})
-        return _normalize_tool_result(raw)
+    client = await _get_client()
+    raw = await client.call_tool("grammo_compiler", {"code": code})
+    return _normalize_tool_result(raw)
+
+
+async def grammo_lark_compile_mcp(code: str) -> tuple[SyntaxCheckResult, CompilationResult]:
+    """Send the syntax check and the compile as two concurrent calls on the shared client.
+
+    These are two separate MCP requests, not a batched server endpoint.
+    """
+    client = await _get_client()
+    raw_lark, raw_compile = await asyncio.gather(
+        client.call_tool("grammo_lark", {"code": code}),
+        client.call_tool("grammo_compiler", {"code": code}),
+    )
+    return _normalize_tool_result(raw_lark), _normalize_tool_result(raw_compile)
 
 
 async def grammo_test_mcp(code: str, tests: str) -> TestResult:
-    async with Client(MCP_URL) as client:
-        raw = await client.call_tool("grammo_test", {"code": code, "tests": tests})
-        return _normalize_tool_result(raw)
+    client = await _get_client()
+    raw = await client.call_tool("grammo_test", {"code": code, "tests": tests})
+    return _normalize_tool_result(raw)
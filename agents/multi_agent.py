@@ -2,6 +2,7 @@ import os
 import time
 import logging
 import re
+from functools import lru_cache
 from typing import Annotated, TypedDict, Any
 
 from tenacity import (
@@ -123,6 +124,9 @@ class _GeminiSafeWrapper:
 
     def __init__(self, llm: Any):
         self._llm = llm
+        # The wrapped model never changes, so resolve its name once
+        self._model_name = (getattr(llm, "model", "") or "").lower()
+        self._is_gemma = "gemma" in self._model_name
 
     def _merge_system_for_gemma(self, valid_msgs: list[BaseMessage]) -> list[BaseMessage]:
         """Merge SystemMessage into first HumanMessage for Gemma models."""
@@ -173,8 +177,7 @@ class _GeminiSafeWrapper:
             valid_msgs.append(m)
 
         # 2. Handle Gemma Specifics
-        model_name = getattr(self._llm, "model", "").lower()
-        if "gemma" in model_name:
+        if self._is_gemma:
             valid_msgs = self._merge_system_for_gemma(valid_msgs)
 
         fallback = os.getenv("GEMINI_FALLBACK_PROMPT", "Continue.")
@@ -259,16 +262,23 @@ class _GeminiSafeWrapper:
         # Exponential backoff fallback: 2 * 2^(attempt-1)
         return min(60, 2 * (2 ** (attempt - 1)))
 
+    # Streams are only retried before their first chunk: a restarted stream
+    # replays from the first token, which a consumer would append to the
+    # partial output it already holds.
+
     def stream(self, input: Any, config: dict | None = None, **kwargs: Any):
         attempt = 0
         max_attempts = 12
         
         while True:
+            started = False
             try:
-                yield from self._llm.stream(self._sanitize_messages(input), config=config, **kwargs)
+                for chunk in self._llm.stream(self._sanitize_messages(input), config=config, **kwargs):
+                    started = True
+                    yield chunk
                 break
             except Exception as e:
-                if is_retryable_error(e):
+                if is_retryable_error(e) and not started:
                     attempt += 1
                     if attempt >= max_attempts:
                         raise
@@ -285,12 +295,14 @@ class _GeminiSafeWrapper:
         import asyncio
 
         while True:
+            started = False
             try:
                 async for chunk in self._llm.astream(self._sanitize_messages(input), config=config, **kwargs):
+                    started = True
                     yield chunk
                 break
             except Exception as e:
-                if is_retryable_error(e):
+                if is_retryable_error(e) and not started:
                     attempt += 1
                     if attempt >= max_attempts:
                         raise
@@ -302,9 +314,8 @@ class _GeminiSafeWrapper:
                     raise
 
     def bind_tools(self, tools: Any, **kwargs: Any) -> "_GeminiSafeWrapper":
-        model_name = getattr(self._llm, "model", "").lower()
-        if "gemma" in model_name:
-            logger.warning(f"Skipping native tool binding for Gemma model '{model_name}'.")
+        if self._is_gemma:
+            logger.warning(f"Skipping native tool binding for Gemma model '{self._model_name}'.")
             return self
 
         bound = self._llm.bind_tools(tools, **kwargs)
@@ -314,10 +325,27 @@ class _GeminiSafeWrapper:
         wso = self._llm.with_structured_output(*args, **kwargs)
         return _GeminiSafeWrapper(wso)
 
+    def with_temperature(self, temperature: float) -> "_GeminiSafeWrapper":
+        """Same wrapped model, sampling at `temperature`."""
+        return _GeminiSafeWrapper(self._llm.model_copy(update={"temperature": temperature}))
+
     def __getattr__(self, name: str) -> Any:
         return getattr(self._llm, name)
 
 
+@lru_cache(maxsize=4)
+def _ollama_llm(model_name: str, base_url: str, keep_alive: str) -> ChatOllama:
+    # One client (and its connection pool) per model/endpoint, shared by every caller
+    return ChatOllama(
+        model=model_name,
+        base_url=base_url,
+        temperature=0,
+        reasoning=True,
+        # Keep the model resident so the shared grammar prefix stays in its KV cache
+        keep_alive=keep_alive,
+    )
+
+
 def build_llm(*, use_gemini: bool = None):
     """
     Build and return the chat model.
@@ -355,9 +383,4 @@ def build_llm(*, use_gemini: bool = None):
 
     model_name = os.getenv("OLLAMA_MODEL", "gpt-oss:20b")
     base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    return ChatOllama(
-        model=model_name,
-        base_url=base_url,
-        temperature=0,
-        reasoning=True,
-    )
\ No newline at end of file
+    return _ollama_llm(model_name, base_url, os.getenv("OLLAMA_KEEP_ALIVE", "30m"))
\ No newline at end of file
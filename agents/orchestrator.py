@@ -3,9 +3,11 @@ from __future__ import annotations
 import json
 import os
 import logging
+import orjson
 import requests
 import re
-from functools import partial
+from requests.adapters import HTTPAdapter
+from functools import cache, partial
 from typing import Any, Literal
 
 from langchain_core.messages import SystemMessage, HumanMessage
@@ -29,6 +31,11 @@ logger = logging.getLogger("orchestrator")
 TESTER_URL = os.getenv("TESTER_URL", "http://127.0.0.1:8088/invoke")
 TESTER_HEALTH_URL = os.getenv("TESTER_HEALTH", "http://127.0.0.1:8088/health")
 
+# Shared keep-alive session: health checks and tester calls reuse pooled connections
+_TESTER_SESSION = requests.Session()
+_TESTER_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_TESTER_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
 # ==========================================
 # 1. UTILITIES
 # ==========================================
@@ -38,7 +45,7 @@ def check_tester_service() -> bool:
     Checks if the Tester FastAPI service is reachable.
     """
     try:
-        response = requests.get(TESTER_HEALTH_URL, timeout=2.0)
+        response = _TESTER_SESSION.get(TESTER_HEALTH_URL, timeout=2.0)
         is_up = response.status_code == 200
         if is_up:
             logger.info(f"✅ Tester Service ONLINE at {TESTER_HEALTH_URL}")
@@ -126,14 +133,14 @@ def tester_node(state: AgentState) -> dict:
     
     try:
         # TIMEOUT set to None to allow infinite wait for local models
-        resp = requests.post(
+        resp = _TESTER_SESSION.post(
             TESTER_URL, 
             json={"task": task, "code": code}, 
             timeout=None 
         )
         
         if resp.status_code == 200:
-            data = resp.json()
+            data = orjson.loads(resp.content)
             if data.get("error"):
                 logger.error(f"Tester logical error: {data['error']}")
                 return {"tester_error": data["error"]}
@@ -151,6 +158,9 @@ def tester_node(state: AgentState) -> dict:
     except requests.exceptions.RequestException as e:
         logger.error(f"❌ Tester connection failed: {e}")
         return {"tester_error": str(e)}
+    except orjson.JSONDecodeError as e:
+        logger.error(f"❌ Tester returned invalid JSON: {e}")
+        return {"tester_error": str(e)}
 
 # ==========================================
 # 3. CONDITIONAL EDGES
@@ -180,7 +190,9 @@ def after_planner(state: AgentState) -> str:
 # 4. APP BUILDER
 # ==========================================
 
+@cache
 def build_app():
+    """Build the orchestrator graph once per process; later calls reuse it."""
     llm = build_llm()
     
     # Build Subgraphs
@@ -168,8 +168,8 @@ def advance_node(state: AgentState) -> dict:
     return {"plan_step": int(state.get("plan_step") or 0) + 1}
 
 
-def generator_no_stream_node(generator_subgraph: Any, state: AgentState, config: RunnableConfig | None = None) -> dict:
-    return generator_subgraph.invoke(state, config=_config_with_stream(config, False))
+async def generator_no_stream_node(generator_subgraph: Any, state: AgentState, config: RunnableConfig | None = None) -> dict:
+    return await generator_subgraph.ainvoke(state, config=_config_with_stream(config, False))
 
 
 class GeneratorNodeWrapper:
@@ -177,8 +177,8 @@ class GeneratorNodeWrapper:
     def __init__(self, generator_subgraph: Any):
         self.generator_subgraph = generator_subgraph
 
-    def __call__(self, state: AgentState, config: RunnableConfig | None = None) -> dict:
-        return generator_no_stream_node(self.generator_subgraph, state, config)
+    async def __call__(self, state: AgentState, config: RunnableConfig | None = None) -> dict:
+        return await generator_no_stream_node(self.generator_subgraph, state, config)
 
 def _wrap_generator_node(generator_subgraph: Any):
     return GeneratorNodeWrapper(generator_subgraph)
@@ -1,11 +1,10 @@
 from langchain_core.messages import SystemMessage
-from integrator import GRAMMO_LARK_SPEC
+from prompts.generator_prompts import GRAMMAR_PREFIX
 
 DEBUGGER_EVALUATOR_SYSTEM = SystemMessage(
     content=(
-        "You are DEBUGGER_EVALUATOR. You are the final step in the pipeline.\n\n"
-        "### CONTEXT: GRAMMAR SPECIFICATION\n"
-        f"{GRAMMO_LARK_SPEC}\n\n"
+        GRAMMAR_PREFIX
+        + "You are DEBUGGER_EVALUATOR. You are the final step in the pipeline.\n\n"
         "### TASK\n"
         "Analyze the Grammo code and the provided Test Results.\n"
         "1. Fix small syntax errors if present.\n"
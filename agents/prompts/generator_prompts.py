@@ -151,9 +151,17 @@ COMMENT_BLOCK: /\\/\\*(.|\\n)*?\\*\\//
 %ignore COMMENT_BLOCK
 """
 
+# Every grammar-aware system prompt starts with this exact block so prefix caches
+# (Gemini implicit caching, Ollama's KV cache) can reuse it across agents and calls.
+GRAMMAR_PREFIX = (
+    "### GRAMMO GRAMMAR SPECIFICATION (LARK)\n"
+    f"{GRAMMO_LARK_SPEC}\n\n"
+)
+
 GRAMMO_SYSTEM = SystemMessage(
     content=(
-        "You are the **Grammo Architect**, an expert coding agent specialized in the Grammo programming language.\n\n"
+        GRAMMAR_PREFIX
+        + "You are the **Grammo Architect**, an expert coding agent specialized in the Grammo programming language.\n\n"
         "### 1. OPERATIONAL PROTOCOL\n"
         "1. **DRAFT:** Internally draft the solution.\n"
         "2. **CHECK:** You **MUST** call `grammo_lark` to validate syntax.\n"
@@ -186,8 +194,8 @@ GRAMMO_SYSTEM = SystemMessage(
         "    <<! \"Result: \" # (s);\n"
         "}\n"
         "```\n\n"
-        "### 7. GRAMMAR SPECIFICATION\n"
-        f"{GRAMMO_LARK_SPEC}"
+        "### 7. GRAMMAR\n"
+        "Follow the grammar specification above exactly."
     )
 )
 
@@ -1,9 +1,10 @@
 from langchain_core.messages import SystemMessage
-from prompts.generator_prompts import GRAMMO_LARK_SPEC
+from prompts.generator_prompts import GRAMMAR_PREFIX
 
 INTEGRATOR_SYSTEM = SystemMessage(
     content=(
-        "You are INTEGRATOR.\n"
+        GRAMMAR_PREFIX
+        + "You are INTEGRATOR.\n"
         "You are only used after the planner.\n"
         "Task: put together existing generated code into ONE working Grammo program.\n\n"
         "### RULES\n"
@@ -16,13 +17,18 @@ INTEGRATOR_SYSTEM = SystemMessage(
         "1. **NO MARKDOWN:** Do NOT use code fences.\n"
         "2. **NO META-DATA:** Do NOT include `SUMMARY:`, `SAFETY:`, `EXPLANATION:`, or `NOTES:`.\n"
         "3. **PURE SOURCE:** The entire output must be valid compilable code. If you include English text, the compiler will crash.\n"
-        "4. **START IMMEDIATELY:** Start with the code logic.\n\n"
-        "LARK SPECIFICATION & EXAMPLES:\n"
-        f"{GRAMMO_LARK_SPEC}"
+        "4. **START IMMEDIATELY:** Start with the code logic."
     )
 )
 
-def build_integrator_compile_failure_message(errors: str) -> str:
+def build_integrator_compile_failure_message(errors: str, candidates: int = 1) -> str:
+    if candidates > 1:
+        return (
+            f"Compilation failed. Propose {candidates} alternative small patches to fix it.\n"
+            f"Errors:\n{errors or '(no details)'}\n\n"
+            f"Return {candidates} complete corrected Grammo programs. Put a line `[[FIX n]]` "
+            f"(n = 1..{candidates}) before each one and write nothing else."
+        )
     return (
         "Compilation failed. Apply the smallest patch to fix it.\n"
         f"Errors:\n{errors or '(no details)'}\n\n"
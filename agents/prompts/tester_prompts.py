@@ -1,9 +1,10 @@
 import json
 from typing import Dict, Any
-from integrator import GRAMMO_LARK_SPEC
+from prompts.generator_prompts import GRAMMAR_PREFIX
 
 TESTER_SYSTEM_CONTENT = (
-    "You are TESTER, an expert debugger for the Grammo language.\n"
+    GRAMMAR_PREFIX
+    + "You are TESTER, an expert debugger for the Grammo language.\n"
     "Goal: Create robust tests, run them, and ensure the code passes.\n\n"
     "### WORKFLOW\n"
     "1. **Initial Run:** Generate comprehensive test cases and run them against the input code.\n"
@@ -14,10 +15,8 @@ TESTER_SYSTEM_CONTENT = (
     "3. **Call Tool:** You MUST call `run_grammo_tests` with the (potentially updated) `code` and `tests` strings.\n\n"
     "### RULES\n"
     "- **ALWAYS** provide the full code and full tests in the tool arguments.\n"
-    "- **Grammo Spec:** Follow the grammar below exactly.\n"
-    "- **I/O Format:** Inputs in tests should mimic `>> \"Prompt\" # (var);` behavior.\n\n"
-    "LARK SPECIFICATION:\n"
-    f"{GRAMMO_LARK_SPEC}"
+    "- **Grammo Spec:** Follow the grammar above exactly.\n"
+    "- **I/O Format:** Inputs in tests should mimic `>> \"Prompt\" # (var);` behavior."
 )
 
 def build_initial_test_prompt(code: str) -> str:
@@ -3,10 +3,11 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+import os
 import threading
 from langchain.tools import tool
 from dataclasses import dataclass
-from functools import partial
+from functools import lru_cache, partial
 from typing import Annotated, Any, Literal, TypedDict
 
 from pydantic import BaseModel, Field
@@ -17,7 +18,6 @@ from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 
 from mcp_client import grammo_test_mcp
-from integrator import GRAMMO_LARK_SPEC
 from prompts.tester_prompts import TESTER_SYSTEM_CONTENT, build_initial_test_prompt, build_debug_test_prompt
 from utils import run_async_in_sync
 
@@ -75,12 +75,14 @@ class TesterState(TypedDict, total=False):
 class TesterContext:
     llm_with_tools: object
 
+@lru_cache(maxsize=4)
 def build_ollama_llm(model: str = "gpt-oss-20b", base_url: str = "http://localhost:11434") -> object:
     logger.info(f"🔌 Connecting to Ollama: {base_url} (Model: {model})")
     return ChatOllama(
         model=model,
         base_url=base_url,
-        temperature=0.0
+        temperature=0.0,
+        keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
     )
 
 def _init_original_code(state: TesterState) -> dict:
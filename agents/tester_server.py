@@ -22,21 +22,22 @@ class A2AResponse(BaseModel):
     tests: str
     result: dict[str, Any]
 
+class HealthResponse(BaseModel):
+    status: str
+    backend: str
+    model: str
+    url: str
+
 # --- Router & Handlers ---
 router = APIRouter()
 
-@router.get("/health")
-def health_check(request: Request):
+@router.get("/health", response_model=HealthResponse)
+def health_check(request: Request) -> HealthResponse:
     """Endpoint to check if the server is online."""
     graph = getattr(request.app.state, "graph", None)
     if graph is None:
         raise HTTPException(status_code=503, detail="Graph not initialized")
-    return {
-        "status": "ok", 
-        "backend": "ollama", 
-        "model": getattr(request.app.state, "ollama_model", "unknown"), 
-        "url": getattr(request.app.state, "ollama_base_url", "unknown")
-    }
+    return request.app.state.health
 
 @router.post("/invoke", response_model=A2AResponse)
 def invoke(req: A2ARequest, request: Request) -> A2AResponse:
@@ -88,6 +89,13 @@ def create_app() -> FastAPI:
     app.state.graph = graph
     app.state.ollama_model = ollama_model
     app.state.ollama_base_url = ollama_base_url
+    # Health payload is constant for the lifetime of the app
+    app.state.health = HealthResponse(
+        status="ok",
+        backend="ollama",
+        model=ollama_model,
+        url=ollama_base_url,
+    )
 
     app.include_router(router)
 
@@ -2,6 +2,7 @@ import asyncio
 import threading
 import re
 import json
+from functools import lru_cache, wraps
 from typing import Any, Optional
 from tenacity import retry_if_exception
 from google.api_core.exceptions import ResourceExhausted
@@ -10,40 +11,49 @@ from google.api_core.exceptions import ResourceExhausted
 # 1. String & Code Sanitization
 # ==========================================
 
+_FENCE_RE = re.compile(r"```(?:\w+)?\s*\n(.*?)\n```", re.DOTALL)
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_DECL_RE = re.compile(r"^[ \t]*(?:func|var)", re.MULTILINE)
+_DECL_PREFIX = ("func", "var")
+
+
 def sanitize_grammo_source(text: str) -> str:
     """Best-effort sanitizer to ensure only Grammo source is returned.
 
     Removes markdown fences and drops leading natural-language/meta lines until
     the first plausible top-level declaration (`func` or `var`).
     """
-    if text is None:
+    if not text:
         return ""
+    if not isinstance(text, str):
+        # Message content may be a list of parts; normalize to a hashable string.
+        text = str(text)
+    # Fast path: already a bare program.
+    if "```" not in text and text.startswith(_DECL_PREFIX):
+        return text.strip()
+
+    return _sanitize_grammo_text(text)
 
-    s = str(text).strip()
+
+@lru_cache(maxsize=32)
+def _sanitize_grammo_text(text: str) -> str:
+    s = text.strip()
     if not s:
         return ""
 
     # Strip markdown code fences if present.
     if '```' in s:
-        m = re.search(r"```(?:\w+)?\s*\n(.*?)\n```", s, flags=re.DOTALL)
+        m = _FENCE_RE.search(s)
         if m:
             s = m.group(1).strip()
         else:
             s = s.replace('```', '').strip()
 
     # Drop leading natural-language / meta lines until we hit 'func' or 'var'.
-    lines = s.splitlines()
-    start_idx = None
-    for i, line in enumerate(lines):
-        line_s = line.lstrip()
-        if not line_s:
-            continue
-        if line_s.startswith(('func', 'var')):
-            start_idx = i
-            break
-
-    if start_idx is not None and start_idx > 0:
-        s = "\n".join(lines[start_idx:]).strip()
+    if not s.startswith(_DECL_PREFIX):
+        m = _DECL_RE.search(s)
+        if m:
+            s = s[m.start():].strip()
 
     return s
 
@@ -53,48 +63,88 @@ def clean_json_text(text: str) -> str:
     text = str(text).strip()
     # Remove markdown code blocks if present
     if "```" in text:
-        match = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+        match = _JSON_FENCE_RE.search(text)
         if match:
             text = match.group(1).strip()
     return text
 
 
+# Compile loops often repeat the same failure; only the latest few distinct ones are kept
+MAX_KEPT_ERRORS = 3
+
+
+def append_or_clear(left: list | None, right: list | None) -> list:
+    """State reducer: append `right` to `left`; an explicit empty list clears the channel.
+
+    Repeats move to the end instead of duplicating, and only the last
+    `MAX_KEPT_ERRORS` entries are kept.
+    """
+    if right is None:
+        return left or []
+    if not right:
+        return []
+    fresh = list(dict.fromkeys(right))
+    return ([e for e in (left or ()) if e not in fresh] + fresh)[-MAX_KEPT_ERRORS:]
+
+
 # ==========================================
 # 2. Async Helper
 # ==========================================
 
-def _target_sync(coro, res: dict[str, Any]):
-    try:
-        new_loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(new_loop)
-        res["value"] = new_loop.run_until_complete(coro)
-    except Exception as e:
-        res["error"] = e
-    finally:
-        try:
-            new_loop.close()
-        except Exception:
-            pass
+# One long-lived loop on a daemon thread hosts every MCP call, so the shared
+# client stays bound to a single loop and no thread/loop is built per call.
+# It is started on first use, so importing this module spawns nothing.
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared background loop, starting its daemon thread on first use."""
+    global _LOOP
+    if _LOOP is None:
+        with _LOOP_LOCK:
+            if _LOOP is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="grammo-async", daemon=True).start()
+                _LOOP = loop
+    return _LOOP
+
 
 def run_async_in_sync(coro):
     """Safely run an async coroutine from a synchronous context."""
     try:
-        # If we are in a loop, we can't use asyncio.run() directly if it's already running
-        # But usually this is called from a thread or a sync context.
-        # If there is a running loop, we must use a thread.
-        asyncio.get_running_loop()
+        running = asyncio.get_running_loop()
     except RuntimeError:
-        # No running loop, safe to use asyncio.run
-        return asyncio.run(coro)
-    else:
-        # Running loop detected, spawn a thread
-        res: dict[str, Any] = {}
-        t = threading.Thread(target=_target_sync, args=(coro, res), daemon=True)
-        t.start()
-        t.join()
-        if "error" in res:
-            raise res["error"]
-        return res.get("value")
+        running = None
+    loop = get_background_loop()
+    if running is loop:
+        # Blocking on our own loop would deadlock; callers there must await.
+        coro.close()
+        raise RuntimeError("run_async_in_sync called from the background loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+async def run_on_background_loop(coro):
+    """Await a coroutine on the shared background loop from any event loop."""
+    loop = get_background_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+async def abatch_run(graph, inputs: list[dict], *, configs: Optional[list[dict]] = None, concurrency: int = 4) -> list[Any]:
+    """Run `graph.ainvoke` over many inputs, at most `concurrency` at a time.
+
+    Results keep input order; a failed run yields its exception instead of a state.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    configs = configs or [None] * len(inputs)
+
+    async def _one(state: dict, config: Optional[dict]) -> Any:
+        async with sem:
+            return await graph.ainvoke(state, config=config)
+
+    return await asyncio.gather(*(_one(s, c) for s, c in zip(inputs, configs)), return_exceptions=True)
 
 
 # ==========================================
@@ -121,6 +171,11 @@ def is_retryable_error(exception: Exception) -> bool:
         
     return False
 
+
+# Pattern for "Please retry in 22.1920s"
+_RETRY_DELAY_RE = re.compile(r"Please retry in ([0-9.]+)s")
+
+
 def extract_retry_delay(exception: Exception, default_delay: float = None) -> float | None:
     """
     Attempts to extract the requested retry delay from an exception.
@@ -133,11 +188,8 @@ def extract_retry_delay(exception: Exception, default_delay: float = None) -> fl
     if hasattr(exception, "__cause__") and exception.__cause__:
         messages_to_check.append(str(exception.__cause__))
 
-    # Pattern for "Please retry in 22.1920s"
-    pattern = r"Please retry in ([0-9\.]+)s"
-    
     for msg in messages_to_check:
-        match = re.search(pattern, msg)
+        match = _RETRY_DELAY_RE.search(msg)
         if match:
             try:
                 val = float(match.group(1))
@@ -146,3 +198,30 @@ def extract_retry_delay(exception: Exception, default_delay: float = None) -> fl
                 pass
 
     return default_delay
+
+
+# ==========================================
+# 4. Graph Caching
+# ==========================================
+
+_PER_LLM_CACHE_MAX = 4
+
+
+def cache_per_llm(build):
+    """Memoize `build(llm)` per model instance, so a compiled graph is built once and reused."""
+    # id(llm) -> (llm, built); holding the llm keeps its id from being reused
+    cache: dict[int, tuple[Any, Any]] = {}
+
+    @wraps(build)
+    def wrapper(llm):
+        entry = cache.get(id(llm))
+        if entry is not None and entry[0] is llm:
+            return entry[1]
+
+        built = build(llm)
+        if len(cache) >= _PER_LLM_CACHE_MAX:
+            cache.pop(next(iter(cache)))
+        cache[id(llm)] = (llm, built)
+        return built
+
+    return wrapper
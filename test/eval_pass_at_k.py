@@ -26,7 +26,8 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "mcp"))
 
 from langchain_core.messages import HumanMessage
 from orchestrator import build_app
-from generator import grammo_compile
+from generator import acompile_grammo
+from utils import abatch_run
 
 # ============================================
 # Task Definitions
@@ -132,47 +133,47 @@ def calculate_pass_at_k(num_correct: int, num_samples: int, k: int) -> float:
         return 1.0 if num_correct > 0 else 0.0
 
 
-def check_compilation(code: str) -> bool:
+async def check_compilation(code: str) -> bool:
     """
-    Verifica se il codice Grammo compila usando grammo_compile.
+    Verifica se il codice Grammo compila usando acompile_grammo.
     """
     try:
-        result = grammo_compile.invoke({"code": code})
+        result = await acompile_grammo(code)
         return bool(result.get("compiled", False))
     except Exception as e:
         print(f"  ⚠️  Compilation check failed: {e}")
         return False
 
 
-async def generate_samples(app, task_prompt: str, num_samples: int) -> List[str]:
+async def generate_samples(app, task_prompt: str, num_samples: int, concurrency: int = 4) -> List[str]:
     """
-    Genera num_samples campioni usando l'agent.
+    Genera num_samples campioni usando l'agent, fino a `concurrency` in parallelo.
     """
     samples = []
-    
-    for i in range(num_samples):
-        try:
-            print(f"  Generating sample {i+1}/{num_samples}...", end=" ")
-            
-            thread_id = str(uuid.uuid4())
-            result = await asyncio.to_thread(
-                app.invoke,
-                {"messages": [HumanMessage(content=task_prompt)]},
-                config={"configurable": {"stream_tokens": False, "thread_id": thread_id}}
-            )
-            
-            # Estrai il codice generato
-            code = result.get("code") or result.get("assembled_code", "")
-            
-            if code and len(code.strip()) > 10:
-                samples.append(code)
-                print(f"✅ Generated ({len(code)} chars)")
-            else:
-                print("❌ Empty or invalid code")
-                
-        except Exception as e:
-            print(f"❌ Error: {e}")
-    
+
+    inputs = [{"messages": [HumanMessage(content=task_prompt)]} for _ in range(num_samples)]
+    configs = [
+        {"configurable": {"stream_tokens": False, "thread_id": str(uuid.uuid4())}}
+        for _ in range(num_samples)
+    ]
+    results = await abatch_run(app, inputs, configs=configs, concurrency=concurrency)
+
+    for i, result in enumerate(results):
+        print(f"  Sample {i+1}/{num_samples}:", end=" ")
+
+        if isinstance(result, Exception):
+            print(f"❌ Error: {result}")
+            continue
+
+        # Estrai il codice generato
+        code = result.get("code") or result.get("assembled_code", "")
+
+        if code and len(code.strip()) > 10:
+            samples.append(code)
+            print(f"✅ Generated ({len(code)} chars)")
+        else:
+            print("❌ Empty or invalid code")
+
     return samples
 
 
@@ -200,7 +201,7 @@ async def evaluate_task(
     # Verifica compilazione
     num_compiled = 0
     for i, code in enumerate(samples):
-        compiled = check_compilation(code)
+        compiled = await check_compilation(code)
         if compiled:
             num_compiled += 1
             print(f"  Sample {i+1}: ✅ Compiled")
@@ -0,0 +1,44 @@
+"""
+Regression tests for trace previews: _safe_preview must print exactly what the
+plain str() preview printed, only cheaper for large containers.
+"""
+
+from __future__ import annotations
+
+import sys
+from collections import deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+import pytest
+
+from agent_client import _safe_preview
+
+
+def _old_preview(v, max_len: int = 220) -> str:
+    s = v if isinstance(v, str) else str(v)
+    if "\n" in s:
+        s = s.replace("\n", "\\n")
+    return s if len(s) <= max_len else (s[: max_len - 3] + "...")
+
+
+class _Obj:
+    def __str__(self) -> str:
+        return "obj:" + "x" * 600
+
+
+@pytest.mark.parametrize("value", [
+    {"b": 1, "a": 2},
+    10 ** 80,
+    {"big": 10 ** 700, "a": 1},
+    {"s": "y\n" * 800},
+    {3, 1, 2},
+    deque([2, 1]),
+    [[[[1]]]] * 200,
+    list(range(1000)),
+    _Obj(),
+])
+@pytest.mark.parametrize("max_len", [220, 500])
+def test_preview_matches_str_preview(value, max_len):
+    assert _safe_preview(value, max_len=max_len) == _old_preview(value, max_len=max_len)
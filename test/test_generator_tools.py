@@ -0,0 +1,37 @@
+"""
+Regression tests for the grammo tools: a malformed tool call must come back to
+the model as an error ToolMessage instead of aborting the ToolNode.
+"""
+
+from __future__ import annotations
+
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.graph import START, MessagesState, StateGraph
+from langgraph.prebuilt import ToolNode
+
+from generator import TOOLS
+
+
+def _call(name: str, args: dict) -> ToolMessage:
+    ai = AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": "call-1"}])
+    g = StateGraph(MessagesState)
+    g.add_node("tools", ToolNode(TOOLS))
+    g.add_edge(START, "tools")
+    out = asyncio.run(g.compile().ainvoke({"messages": [ai]}))
+    return out["messages"][-1]
+
+
+@pytest.mark.parametrize("name", ["grammo_lark", "grammo_compile"])
+@pytest.mark.parametrize("args", [{}, {"source": "func void -> main() {}"}])
+def test_malformed_tool_call_returns_error_message(name, args):
+    msg = _call(name, args)
+    assert isinstance(msg, ToolMessage)
+    assert msg.status == "error"
+    assert "code" in msg.content
@@ -0,0 +1,96 @@
+"""
+Regression tests for how integrator_generate turns a reply into code: where a
+streamed reply is cut (_reply_end), that the partial trailer never reaches
+code/history, that a rate limit mid-stream does not duplicate the partial
+reply, and that [[FIX n]] replies only yield real programs.
+"""
+
+from __future__ import annotations
+
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from google.api_core.exceptions import ResourceExhausted
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import integrator
+from multi_agent import _GeminiSafeWrapper
+
+
+PROGRAM = "func void -> main() {\n    return;\n}"
+
+
+class _ScriptedLLM(BaseChatModel):
+    """Streams `text` in 4-char chunks; optionally fails once after `fail_after` chunks."""
+
+    text: str
+    fail_after: int | None = None
+    streamed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.text))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for i in range(0, len(self.text), 4):
+            if self.fail_after is not None and self.streamed == self.fail_after:
+                self.fail_after = None
+                raise ResourceExhausted("429 Please retry in 0s")
+            self.streamed += 1
+            yield ChatGenerationChunk(message=AIMessageChunk(content=self.text[i:i + 4]))
+
+
+def _generate(llm) -> dict:
+    ctx = integrator.IntegratorContext(llm_with_tools=llm)
+    state = {"messages": [HumanMessage(content="task")], "task": "t"}
+    return asyncio.run(integrator.integrator_generate(ctx, state))
+
+
+def test_reply_end_cuts_at_trailer():
+    text = "func main() { x }\nSUMMARY: this code"
+    assert text[: integrator._reply_end(text)].rstrip() == "func main() { x }"
+
+
+def test_reply_end_cuts_after_closing_fence():
+    text = "Here:\n```c\n" + PROGRAM + "\n```\nThanks"
+    assert text[: integrator._reply_end(text)].endswith(PROGRAM + "\n```")
+
+
+def test_reply_end_waits_for_open_program_and_fix_blocks():
+    assert integrator._reply_end("func a() {\n    x: y") is None
+    assert integrator._reply_end("```c\nfunc a() {") is None
+    assert integrator._reply_end("[[FIX 1]]\n```\nfunc a\n```") is None
+
+
+def test_partial_trailer_is_dropped():
+    out = _generate(_ScriptedLLM(text="func main() { x }\nSUMMARY: this code does things"))
+    assert out["code"] == "func main() { x }"
+    assert out["messages"][0].content == "func main() { x }"
+
+
+def test_fenced_reply_stops_streaming_and_keeps_program():
+    llm = _ScriptedLLM(text="```c\n" + PROGRAM + "\n```\n\nSUMMARY: returns. " + "blah " * 50)
+    out = _generate(llm)
+    assert out["code"] == PROGRAM
+    assert llm.streamed < len(range(0, len(llm.text), 4))
+
+
+def test_rate_limit_mid_stream_does_not_duplicate_reply():
+    llm = _ScriptedLLM(text=PROGRAM, fail_after=3)
+    out = _generate(_GeminiSafeWrapper(llm))
+    assert out["code"] == PROGRAM
+
+
+def test_fix_blocks_skip_leading_prose():
+    text = "Here are the fixes.\n[[FIX 1]]\nfunc void -> main() { a }\n[[FIX 2]]\n" + PROGRAM
+    out = _generate(_ScriptedLLM(text=text))
+    assert out["candidates"] == ["func void -> main() { a }", PROGRAM]
+    assert out["code"] == "func void -> main() { a }"